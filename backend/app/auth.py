@@ -1,14 +1,21 @@
+import functools
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 import bcrypt
+import jwt
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from jwt import InvalidTokenError as JWTError
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "4096"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login", auto_error=False)
 
@@ -36,29 +43,39 @@ USERS = {
     }
 }
 
+_token_cache: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+_token_cache_lock = threading.Lock()
+
 if user_password_hash.startswith("$2a$"):
     raise RuntimeError(
         "USER_PASSWORD_HASH uses deprecated bcrypt prefix $2a$. Regenerate with $2b$."
     )
 
+if not re.fullmatch(r"\$2[by]\$\d{2}\$[./A-Za-z0-9]{53}", user_password_hash):
+    raise RuntimeError("USER_PASSWORD_HASH is not a valid bcrypt hash.")
+
+
+@functools.cache
+def get_dummy_password_hash():
+    # Reuse the configured hash's salt so the dummy check runs at exactly the same cost.
+    # Built on first use: every process importing this module (including pool
+    # workers) would otherwise pay for a full bcrypt round at import.
+    return bcrypt.hashpw(b"dummy-password", user_password_hash.encode("utf-8"))
+
 
 def authenticate_user(username: str, password: str):
     user = USERS.get(username)
-    if not user:
-        return None
+    # Check against a dummy hash for unknown users so both paths cost the same.
+    password_hash = (
+        user["password_hash"].encode("utf-8") if user else get_dummy_password_hash()
+    )
 
     try:
-        ok = bcrypt.checkpw(
-            password.encode("utf-8"),
-            user["password_hash"].encode("utf-8"),
-        )
+        ok = bcrypt.checkpw(password.encode("utf-8"), password_hash)
     except ValueError:
         return None
 
-    if not ok:
-        return None
-
-    return user
+    return user if user and ok else None
 
 
 def create_access_token(data: dict):
@@ -68,7 +85,36 @@ def create_access_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def get_cached_user(token: str):
+    now = time.time()
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is None:
+            return None
+        user, exp = entry
+        if exp <= now:
+            _token_cache.pop(token, None)
+            return None
+        _token_cache.move_to_end(token)
+        return user
+
+
+def cache_user(token: str, user: dict, exp: float):
+    if TOKEN_CACHE_MAX_ENTRIES <= 0:
+        return
+    with _token_cache_lock:
+        _token_cache[token] = (user, exp)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+            _token_cache.popitem(last=False)
+
+
 def decode_current_user(token: str):
+    # Skip signature verification for tokens that were already validated and not yet expired.
+    cached = get_cached_user(token)
+    if cached is not None:
+        return cached
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -77,10 +123,14 @@ def decode_current_user(token: str):
         user = USERS.get(username)
         if user is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-        return user
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        cache_user(token, user, float(exp))
+    return user
+
 
 def get_current_user(request: Request, token: str | None = Depends(oauth2_scheme)):
     if not token:
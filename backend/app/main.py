@@ -1,13 +1,23 @@
+import asyncio
+import fcntl
+import functools
+import multiprocessing
 import os
 import re
 import sqlite3
+import stat
+import tempfile
 import threading
 import time
-from contextlib import closing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
 from urllib.parse import quote
 
 import fitz
 from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.security import OAuth2PasswordRequestForm
@@ -19,7 +29,24 @@ from .auth import (
     get_current_user,
 )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(init_search_db)
+    # Indexing and thumbnail rendering can take minutes on a large library,
+    # so they run in the background instead of delaying readiness.
+    tasks = [
+        asyncio.create_task(warm_up()),
+        asyncio.create_task(periodic_search_index_sync()),
+    ]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS（React用）
 app.add_middleware(
@@ -34,11 +61,16 @@ BASE_DIR = os.path.dirname(__file__)
 PDF_DIR = os.path.join(BASE_DIR, "resources/pdfs")
 THUMB_DIR = os.path.join(BASE_DIR, "resources/thumbnails")
 DB_PATH = os.path.join(BASE_DIR, "resources/search.db")
+SEARCH_INDEX_LOCK_PATH = os.path.join(BASE_DIR, "resources/search.lock")
+SEARCH_SCHEMA_LOCK_PATH = os.path.join(BASE_DIR, "resources/search-schema.lock")
+THUMBNAIL_PREWARM_LOCK_PATH = os.path.join(BASE_DIR, "resources/thumbnails.lock")
 
 os.makedirs(PDF_DIR, exist_ok=True)
 os.makedirs(THUMB_DIR, exist_ok=True)
 
-TOKENS = set()
+# Resolved once; the base directories never change at runtime.
+PDF_DIR_REAL = os.path.realpath(PDF_DIR)
+THUMB_DIR_REAL = os.path.realpath(THUMB_DIR)
 
 
 def parse_bool_env(name: str, default: bool):
@@ -52,15 +84,29 @@ COOKIE_SECURE = parse_bool_env("COOKIE_SECURE", True)
 LOGIN_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("LOGIN_RATE_LIMIT_WINDOW_SECONDS", "300"))
 LOGIN_RATE_LIMIT_MAX_ATTEMPTS = int(os.getenv("LOGIN_RATE_LIMIT_MAX_ATTEMPTS", "5"))
 LOGIN_RATE_LIMIT_BLOCK_SECONDS = int(os.getenv("LOGIN_RATE_LIMIT_BLOCK_SECONDS", "300"))
+LOGIN_RATE_LIMIT_MAX_ENTRIES = int(os.getenv("LOGIN_RATE_LIMIT_MAX_ENTRIES", "100000"))
 SEARCH_INDEX_SYNC_MIN_INTERVAL_SECONDS = int(
     os.getenv("SEARCH_INDEX_SYNC_MIN_INTERVAL_SECONDS", "30")
 )
 PREWARM_THUMBNAILS_ON_STARTUP = parse_bool_env("PREWARM_THUMBNAILS_ON_STARTUP", True)
-
-_login_attempts: dict[tuple[str, str], list[float]] = {}
-_login_blocked_until: dict[tuple[str, str], float] = {}
+# Without nginx in front (e.g. running uvicorn directly), stream thumbnails from Python.
+THUMBNAIL_X_ACCEL_REDIRECT = parse_bool_env("THUMBNAIL_X_ACCEL_REDIRECT", True)
+SEARCH_INDEX_WORKERS = int(os.getenv("SEARCH_INDEX_WORKERS", str(os.cpu_count() or 1)))
+SEARCH_INDEX_BULK_THRESHOLD = 16
+# Rasterizing contends on MuPDF beyond a few processes, so cap the default at 4.
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(min(os.cpu_count() or 1, 4))))
+THUMBNAIL_FAILURES_MAX_ENTRIES = 1024
+
+# Per (ip, username), least recently failed first; both capped at MAX_ENTRIES.
+_login_attempts: OrderedDict[tuple[str, str], deque[float]] = OrderedDict()
+_login_blocked_until: OrderedDict[tuple[str, str], float] = OrderedDict()
 _search_sync_lock = threading.Lock()
 _search_last_synced_at = 0.0
+_db_local = threading.local()
+_pdfs_cache: tuple[int, list[dict]] | None = None
+_pdfs_cache_lock = threading.Lock()
+# PDFs whose thumbnail failed to render, by path -> st_mtime_ns at the failure.
+_thumbnail_failures: OrderedDict[str, int] = OrderedDict()
 
 
 def get_client_ip(request: Request):
@@ -75,20 +121,30 @@ def get_client_ip(request: Request):
 def is_login_blocked(key: tuple[str, str], now: float):
     blocked_until = _login_blocked_until.get(key, 0.0)
     if blocked_until > now:
-        return int(blocked_until - now)
+        return max(int(blocked_until - now), 1)
     if blocked_until:
         _login_blocked_until.pop(key, None)
     return 0
 
 
 def register_login_failure(key: tuple[str, str], now: float):
-    cutoff = now - LOGIN_RATE_LIMIT_WINDOW_SECONDS
-    attempts = [t for t in _login_attempts.get(key, []) if t >= cutoff]
+    # Only the last max_attempts failures can decide a block, so keep no more.
+    attempts = _login_attempts.pop(key, None)
+    if attempts is None:
+        attempts = deque(maxlen=max(LOGIN_RATE_LIMIT_MAX_ATTEMPTS, 1))
     attempts.append(now)
-    _login_attempts[key] = attempts
-    if len(attempts) >= LOGIN_RATE_LIMIT_MAX_ATTEMPTS:
+    if (
+        len(attempts) >= LOGIN_RATE_LIMIT_MAX_ATTEMPTS
+        and attempts[0] >= now - LOGIN_RATE_LIMIT_WINDOW_SECONDS
+    ):
+        _login_blocked_until.pop(key, None)
         _login_blocked_until[key] = now + LOGIN_RATE_LIMIT_BLOCK_SECONDS
-        _login_attempts.pop(key, None)
+        while len(_login_blocked_until) > LOGIN_RATE_LIMIT_MAX_ENTRIES:
+            _login_blocked_until.popitem(last=False)
+        return
+    _login_attempts[key] = attempts
+    while len(_login_attempts) > LOGIN_RATE_LIMIT_MAX_ENTRIES:
+        _login_attempts.popitem(last=False)
 
 
 def clear_login_failures(key: tuple[str, str]):
@@ -97,9 +153,9 @@ def clear_login_failures(key: tuple[str, str]):
 
 
 @app.post("/login")
-def login(
+async def login(
     request: Request, response: Response, form: OAuth2PasswordRequestForm = Depends()
-):
+) -> dict:
     now = time.time()
     key = (get_client_ip(request), form.username.strip())
     blocked_seconds = is_login_blocked(key, now)
@@ -108,7 +164,8 @@ def login(
             status_code=429, detail=f"too many login attempts; retry in {blocked_seconds}s"
         )
 
-    user = authenticate_user(form.username, form.password)
+    # bcrypt is CPU-bound; keep it off the event loop.
+    user = await run_in_threadpool(authenticate_user, form.username, form.password)
     if not user:
         register_login_failure(key, now)
         raise HTTPException(status_code=401)
@@ -127,7 +184,7 @@ def login(
 
 
 @app.post("/logout")
-def logout(response: Response):
+async def logout(response: Response) -> dict:
     response.delete_cookie(
         key="access_token", httponly=True, samesite="lax", secure=COOKIE_SECURE
     )
@@ -135,39 +192,169 @@ def logout(response: Response):
 
 
 def generate_thumbnail(pdf_path, thumb_path):
-    doc = fitz.open(pdf_path)
-    page = doc.load_page(0)
-    # Generate lightweight thumbnails (target width around 320px) for faster list loading.
-    target_width = 320
-    zoom = target_width / max(page.rect.width, 1)
-    zoom = min(max(zoom, 0.3), 1.0)
-    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
-    pix.save(thumb_path, jpg_quality=72)
+    with fitz.open(pdf_path) as doc:
+        page = doc.load_page(0)
+        # Generate lightweight thumbnails (target width around 320px) for faster list loading.
+        target_width = 320
+        zoom = target_width / max(page.rect.width, 1)
+        zoom = min(max(zoom, 0.3), 1.0)
+        pix = page.get_pixmap(
+            matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False
+        )
+    data = pix.tobytes("jpeg", jpg_quality=72)
+
+    # Write to a unique temp file and rename, so a concurrent request never
+    # serves a half-written JPEG while prewarm and on-demand rendering race.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(thumb_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, thumb_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def iter_pdf_entries():
+    # DirEntry caches type and stat data, saving a syscall per file for callers.
+    with os.scandir(PDF_DIR) as it:
+        for entry in it:
+            if entry.name.lower().endswith(".pdf") and entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def find_pdf_for_thumbnail(thumb_name: str):
+    thumb_stem, _ = os.path.splitext(thumb_name)
+    pdf_path = os.path.join(PDF_DIR, f"{thumb_stem}.pdf")
+    if is_regular_file(pdf_path):
+        return pdf_path
+    # Only other-case extensions (e.g. ".PDF") get here; the cached listing
+    # answers without rescanning the directory for names that never exist.
+    _, pdfs = get_cached_pdf_list()
+    for pdf in pdfs:
+        if pdf["id"][:-4] == thumb_stem:
+            return os.path.join(PDF_DIR, pdf["id"])
+    return None
+
+
+def get_process_pool_context():
+    # forkserver avoids forking the threaded server process.
+    return multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
 
 
 def prewarm_thumbnails():
-    pdf_files = [f for f in os.listdir(PDF_DIR) if f.lower().endswith(".pdf")]
-    for pdf_file in pdf_files:
-        file_stem, _ = os.path.splitext(pdf_file)
-        thumb_name = f"{file_stem}.jpg"
-        thumb_path = os.path.join(THUMB_DIR, thumb_name)
-        if os.path.exists(thumb_path):
-            continue
-        try:
-            generate_thumbnail(os.path.join(PDF_DIR, pdf_file), thumb_path)
-        except Exception as e:  # noqa: BLE001
-            # Continue startup even if a specific thumbnail cannot be generated.
-            print(f"[startup] thumbnail generation failed: {pdf_file} ({e})")
+    with os.scandir(THUMB_DIR) as it:
+        thumb_names = {entry.name for entry in it}
+
+    jobs = []
+    for entry in iter_pdf_entries():
+        thumb_name = f"{entry.name[:-4]}.jpg"
+        if thumb_name not in thumb_names:
+            jobs.append((entry.name, entry.path, os.path.join(THUMB_DIR, thumb_name)))
+
+    workers = min(THUMBNAIL_WORKERS, len(jobs))
+    if workers <= 1:
+        for pdf_file, pdf_path, thumb_path in jobs:
+            try:
+                generate_thumbnail(pdf_path, thumb_path)
+            except Exception as e:  # noqa: BLE001
+                # Continue startup even if a specific thumbnail cannot be generated.
+                print(f"[startup] thumbnail generation failed: {pdf_file} ({e})")
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_process_pool_context()
+    ) as executor:
+        futures = {
+            executor.submit(generate_thumbnail, pdf_path, thumb_path): pdf_file
+            for pdf_file, pdf_path, thumb_path in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:  # noqa: BLE001
+                # Continue startup even if a specific thumbnail cannot be generated.
+                print(f"[startup] thumbnail generation failed: {futures[future]} ({e})")
+
+
+def maybe_prewarm_thumbnails():
+    # One worker renders; the others would only repeat the same work.
+    with exclusive_file_lock(THUMBNAIL_PREWARM_LOCK_PATH, blocking=False) as locked:
+        if not locked:
+            return False
+        prewarm_thumbnails()
+        return True
 
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    # One long-lived connection per thread; the threadpool reuses its workers.
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Truncate the WAL after checkpoints so a bulk index run doesn't leave it huge.
+        conn.execute("PRAGMA journal_size_limit=67108864")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")
+        _db_local.conn = conn
     return conn
 
 
+def get_read_db_connection():
+    # Search handlers only read; a read-only handle can never take the write
+    # lock, and under WAL it reads a snapshot without waiting on the indexer.
+    conn = getattr(_db_local, "read_conn", None)
+    if conn is None:
+        conn = sqlite3.connect(f"file:{quote(DB_PATH)}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=ON")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-65536")
+        _db_local.read_conn = conn
+    return conn
+
+
+@contextmanager
+def exclusive_file_lock(path: str, blocking: bool = True):
+    # Serializes work across uvicorn worker processes; yields False if busy.
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)
+
+
+SEARCH_SCHEMA_OBJECTS = {
+    "pdf_index_meta",
+    "pdf_pages",
+    "pdf_pages_pdf_id",
+    "pdf_index",
+    "pdf_pages_ai",
+    "pdf_pages_ad",
+}
+
+
 def init_search_db():
-    with closing(get_db_connection()) as conn:
+    conn = get_db_connection()
+    # Reading sqlite_master never waits on a running sync, so an up-to-date
+    # database skips the DDL (and its write lock) entirely.
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    if SEARCH_SCHEMA_OBJECTS <= existing:
+        return
+    # Not the sync lock: a sync can hold that for minutes.
+    with exclusive_file_lock(SEARCH_SCHEMA_LOCK_PATH), conn:
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS pdf_index_meta (
@@ -178,6 +365,29 @@ def init_search_db():
             )
             """
         )
+        has_pages_table = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pdf_pages'"
+        ).fetchone()
+        if not has_pages_table:
+            # Older databases keep the text inside pdf_index itself; rebuild from scratch.
+            conn.execute("DROP TABLE IF EXISTS pdf_index")
+            conn.execute("DELETE FROM pdf_index_meta")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pdf_pages (
+                id INTEGER PRIMARY KEY,
+                pdf_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                content TEXT NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS pdf_pages_pdf_id ON pdf_pages (pdf_id)"
+        )
+        # External-content FTS5: the text lives only in pdf_pages, which the
+        # triggers below keep in sync with the full-text index.
         conn.execute(
             """
             CREATE VIRTUAL TABLE IF NOT EXISTS pdf_index USING fts5 (
@@ -185,93 +395,196 @@ def init_search_db():
                 title,
                 page UNINDEXED,
                 content,
+                content='pdf_pages',
+                content_rowid='id',
                 tokenize='unicode61'
             )
             """
         )
-        conn.commit()
+        conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS pdf_pages_ai AFTER INSERT ON pdf_pages BEGIN
+                INSERT INTO pdf_index (rowid, pdf_id, title, page, content)
+                VALUES (new.id, new.pdf_id, new.title, new.page, new.content);
+            END
+            """
+        )
+        conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS pdf_pages_ad AFTER DELETE ON pdf_pages BEGIN
+                INSERT INTO pdf_index (pdf_index, rowid, pdf_id, title, page, content)
+                VALUES ('delete', old.id, old.pdf_id, old.title, old.page, old.content);
+            END
+            """
+        )
 
 
-def resolve_safe_path(base_dir: str, file_name: str, ext: str):
+def resolve_safe_path(base_dir_real: str, file_name: str, ext: str):
     if os.path.basename(file_name) != file_name:
         raise HTTPException(status_code=404)
     if not file_name.lower().endswith(ext):
         raise HTTPException(status_code=404)
 
-    base = os.path.realpath(base_dir)
-    path = os.path.realpath(os.path.join(base, file_name))
-    if not path.startswith(f"{base}{os.sep}"):
+    if "\0" in file_name:
         raise HTTPException(status_code=404)
-    return path
+
+    # A bare file name joined to the resolved base cannot leave it, so no
+    # per-request realpath is needed; symlinks are rejected by the callers' lstat.
+    return os.path.join(base_dir_real, file_name)
+
+
+def is_regular_file(path: str):
+    try:
+        return stat.S_ISREG(os.lstat(path).st_mode)
+    except OSError:
+        return False
 
 
 def clean_text(text: str):
-    return re.sub(r"\s+", " ", text).strip()
+    # Same result as re.sub(r"\s+", " ", text).strip(), but the split runs entirely in C.
+    return " ".join(text.split())
 
 
-def index_pdf(pdf_id: str):
-    pdf_path = os.path.join(PDF_DIR, pdf_id)
-    mtime = os.path.getmtime(pdf_path)
+# Broken PDFs surface as exceptions that the indexer and thumbnail code log
+# themselves; MuPDF's own stderr dump would just repeat them per object.
+fitz.TOOLS.mupdf_display_errors(False)
 
-    with closing(get_db_connection()) as conn:
-        row = conn.execute(
-            "SELECT mtime FROM pdf_index_meta WHERE pdf_id = ?", (pdf_id,)
-        ).fetchone()
-        if row and row["mtime"] == mtime:
-            return
+# Whitespace is collapsed by clean_text anyway, so MuPDF need not preserve it.
+# Expanding ligatures lets words containing "fi"/"fl" match the way they are typed.
+PDF_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~(
+    fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_LIGATURES
+)
 
-        with fitz.open(pdf_path) as doc:
-            page_count = doc.page_count
-            rows = []
-            for i, page in enumerate(doc):
-                text = clean_text(page.get_text("text"))
-                if text:
-                    rows.append((pdf_id, pdf_id, i + 1, text))
-
-        conn.execute("DELETE FROM pdf_index WHERE pdf_id = ?", (pdf_id,))
-        if rows:
-            conn.executemany(
-                "INSERT INTO pdf_index (pdf_id, title, page, content) VALUES (?, ?, ?, ?)",
-                rows,
-            )
 
-        conn.execute(
-            """
-            INSERT INTO pdf_index_meta (pdf_id, mtime, page_count, updated_at)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            ON CONFLICT(pdf_id) DO UPDATE SET
-                mtime = excluded.mtime,
-                page_count = excluded.page_count,
-                updated_at = CURRENT_TIMESTAMP
-            """,
-            (pdf_id, mtime, page_count),
-        )
-        conn.commit()
+def iter_pdf_rows(doc: fitz.Document, pdf_id: str):
+    for i, page in enumerate(doc):
+        text = clean_text(page.get_text("text", flags=PDF_TEXT_FLAGS))
+        if text:
+            yield (pdf_id, pdf_id, i + 1, text)
 
 
-def sync_search_index():
-    pdf_files = {
-        file_name for file_name in os.listdir(PDF_DIR) if file_name.lower().endswith(".pdf")
-    }
+def extract_pdf_rows(pdf_path: str, pdf_id: str):
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count, list(iter_pdf_rows(doc, pdf_id))
+
+
+def write_pdf_index(
+    conn: sqlite3.Connection, pdf_id: str, mtime: float, page_count: int, rows
+):
+    conn.execute("DELETE FROM pdf_pages WHERE pdf_id = ?", (pdf_id,))
+    # executemany consumes rows lazily, so a generator streams pages straight into FTS5.
+    conn.executemany(
+        "INSERT INTO pdf_pages (pdf_id, title, page, content) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+
+    conn.execute(
+        """
+        INSERT INTO pdf_index_meta (pdf_id, mtime, page_count, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(pdf_id) DO UPDATE SET
+            mtime = excluded.mtime,
+            page_count = excluded.page_count,
+            updated_at = CURRENT_TIMESTAMP
+        """,
+        (pdf_id, mtime, page_count),
+    )
+
 
-    with closing(get_db_connection()) as conn:
-        indexed = {
-            row["pdf_id"] for row in conn.execute("SELECT pdf_id FROM pdf_index_meta")
+def index_pdfs_parallel(conn: sqlite3.Connection, targets: dict[str, float]):
+    workers = min(SEARCH_INDEX_WORKERS, len(targets))
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_process_pool_context()
+    ) as executor:
+        futures = {
+            executor.submit(extract_pdf_rows, os.path.join(PDF_DIR, pdf_id), pdf_id): pdf_id
+            for pdf_id in targets
         }
-        stale = indexed - pdf_files
-        for pdf_id in stale:
-            conn.execute("DELETE FROM pdf_index WHERE pdf_id = ?", (pdf_id,))
-            conn.execute("DELETE FROM pdf_index_meta WHERE pdf_id = ?", (pdf_id,))
-        conn.commit()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for future in as_completed(futures):
+                # Drop the future once written so its rows are freed.
+                pdf_id = futures.pop(future)
+                try:
+                    page_count, rows = future.result()
+                except BrokenProcessPool as e:
+                    # A dead worker fails every pending file, not just its own;
+                    # leave them unrecorded so the next sync retries them.
+                    print(f"[search-index] indexing interrupted: {pdf_id} ({e})")
+                    continue
+                except Exception as e:  # noqa: BLE001
+                    print(f"[search-index] indexing failed: {pdf_id} ({e})")
+                    # An empty entry at this mtime skips the file until it changes.
+                    page_count, rows = 0, ()
+                write_pdf_index(conn, pdf_id, targets[pdf_id], page_count, rows)
+
+
+def index_pdfs_serial(conn: sqlite3.Connection, targets: dict[str, float]):
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for pdf_id, mtime in targets.items():
+            # A savepoint per file drops the partial rows of a PDF that fails mid-way.
+            conn.execute("SAVEPOINT index_pdf")
+            try:
+                with fitz.open(os.path.join(PDF_DIR, pdf_id)) as doc:
+                    write_pdf_index(
+                        conn, pdf_id, mtime, doc.page_count, iter_pdf_rows(doc, pdf_id)
+                    )
+            except Exception as e:  # noqa: BLE001
+                conn.execute("ROLLBACK TO index_pdf")
+                print(f"[search-index] indexing failed: {pdf_id} ({e})")
+                # An empty entry at this mtime skips the file until it changes.
+                write_pdf_index(conn, pdf_id, mtime, 0, ())
+            conn.execute("RELEASE index_pdf")
+
+
+def sync_search_index():
+    pdf_mtimes = {entry.name: entry.stat().st_mtime for entry in iter_pdf_entries()}
 
-    for pdf_id in pdf_files:
-        index_pdf(pdf_id)
+    conn = get_db_connection()
+    indexed = {
+        row["pdf_id"]: row["mtime"]
+        for row in conn.execute("SELECT pdf_id, mtime FROM pdf_index_meta")
+    }
+    stale = [(pdf_id,) for pdf_id in indexed.keys() - pdf_mtimes.keys()]
+    if stale:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM pdf_pages WHERE pdf_id = ?", stale)
+            conn.executemany("DELETE FROM pdf_index_meta WHERE pdf_id = ?", stale)
+
+    targets = {
+        pdf_id: mtime
+        for pdf_id, mtime in pdf_mtimes.items()
+        if indexed.get(pdf_id) != mtime
+    }
+    if not targets:
+        return
+
+    bulk = len(targets) >= SEARCH_INDEX_BULK_THRESHOLD
+    if bulk:
+        # The index can always be rebuilt from the PDFs, so trade durability for speed.
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA cache_size=-262144")
+    try:
+        if len(targets) > 1 and SEARCH_INDEX_WORKERS > 1:
+            index_pdfs_parallel(conn, targets)
+        else:
+            index_pdfs_serial(conn, targets)
+        if bulk:
+            # Merge the per-transaction FTS segments so queries touch fewer b-trees.
+            with conn:
+                conn.execute("INSERT INTO pdf_index(pdf_index) VALUES('optimize')")
+    finally:
+        if bulk:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-65536")
 
 
 def maybe_sync_search_index(force: bool = False):
     global _search_last_synced_at
 
-    now = time.time()
+    now = time.monotonic()
     if (
         not force
         and SEARCH_INDEX_SYNC_MIN_INTERVAL_SECONDS > 0
@@ -284,28 +597,34 @@ def maybe_sync_search_index(force: bool = False):
         return False
 
     try:
-        now = time.time()
+        now = time.monotonic()
         if (
             not force
             and SEARCH_INDEX_SYNC_MIN_INTERVAL_SECONDS > 0
             and now - _search_last_synced_at < SEARCH_INDEX_SYNC_MIN_INTERVAL_SECONDS
         ):
             return False
-        sync_search_index()
-        _search_last_synced_at = time.time()
+        with exclusive_file_lock(SEARCH_INDEX_LOCK_PATH, blocking=False) as locked:
+            if not locked:
+                return False
+            sync_search_index()
+        _search_last_synced_at = time.monotonic()
         return True
     finally:
         _search_sync_lock.release()
 
 
+_FTS_TERM_RE = re.compile(r'"([^"]+)"|([0-9A-Za-z_一-龯ぁ-ゔァ-ヴー々〆〤]+)')
+
+
+@functools.lru_cache(maxsize=1024)
 def build_fts_query(q: str):
     normalized = q.strip()
     if not normalized:
         raise HTTPException(status_code=400, detail="query is required")
 
     parts = []
-    token_re = r"[0-9A-Za-z_一-龯ぁ-ゔァ-ヴー々〆〤]+"
-    for m in re.finditer(rf'"([^"]+)"|({token_re})', normalized):
+    for m in _FTS_TERM_RE.finditer(normalized):
         phrase = m.group(1)
         token = m.group(2)
 
@@ -319,8 +638,9 @@ def build_fts_query(q: str):
         if token is None:
             continue
 
+        # Quote tokens so words like AND/OR/NEAR are not parsed as FTS5 operators.
         # Prefix search on each token for practical partial matching.
-        parts.append(f"content:{token}*" if len(token) >= 2 else f"content:{token}")
+        parts.append(f'content:"{token}"*' if len(token) >= 2 else f'content:"{token}"')
 
     if not parts:
         escaped = normalized.replace('"', '""')
@@ -329,31 +649,35 @@ def build_fts_query(q: str):
     return " AND ".join(parts)
 
 
-@app.on_event("startup")
-def startup():
-    init_search_db()
-    maybe_sync_search_index(force=True)
+async def warm_up():
+    try:
+        await run_in_threadpool(maybe_sync_search_index, True)
+    except Exception as e:  # noqa: BLE001
+        # The periodic sync retries, so serving continues with the current index.
+        print(f"[startup] search index sync failed: {e}")
     if PREWARM_THUMBNAILS_ON_STARTUP:
-        prewarm_thumbnails()
+        await run_in_threadpool(maybe_prewarm_thumbnails)
 
 
-@app.get("/pdfs")
-def list_pdfs(user=Depends(get_current_user)):
-    maybe_sync_search_index(force=False)
-    pdfs = []
-
-    for file in os.listdir(PDF_DIR):
-        if not file.lower().endswith(".pdf"):
-            continue
+async def periodic_search_index_sync():
+    interval = max(SEARCH_INDEX_SYNC_MIN_INTERVAL_SECONDS, 1)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(maybe_sync_search_index, True)
+        except Exception as e:  # noqa: BLE001
+            # Keep refreshing even if a single sync fails.
+            print(f"[search-index] sync failed: {e}")
 
-        pdf_id = file
-        file_stem, _ = os.path.splitext(file)
-        thumb_name = f"{file_stem}.jpg"
-        thumb_path = os.path.join(THUMB_DIR, thumb_name)
 
-        if not os.path.exists(thumb_path):
-            generate_thumbnail(os.path.join(PDF_DIR, file), thumb_path)
+def build_pdf_list():
+    pdfs = []
 
+    for entry in iter_pdf_entries():
+        file = entry.name
+        pdf_id = file
+        # Missing thumbnails are rendered on first request by get_thumbnail.
+        thumb_name = f"{file[:-4]}.jpg"
         pdfs.append(
             {"id": pdf_id, "title": file, "thumbnail_url": f"/thumbnail/{thumb_name}"}
         )
@@ -361,6 +685,33 @@ def list_pdfs(user=Depends(get_current_user)):
     return pdfs
 
 
+def get_cached_pdf_list():
+    global _pdfs_cache
+
+    # Adding, removing or renaming a PDF bumps the directory mtime, which is
+    # all the listing depends on.
+    mtime_ns = os.stat(PDF_DIR).st_mtime_ns
+    with _pdfs_cache_lock:
+        if _pdfs_cache is None or _pdfs_cache[0] != mtime_ns:
+            _pdfs_cache = (mtime_ns, build_pdf_list())
+        return _pdfs_cache
+
+
+@app.get("/pdfs")
+def list_pdfs(
+    request: Request,
+    response: Response,
+    user=Depends(get_current_user),
+) -> list[dict]:
+    mtime_ns, pdfs = get_cached_pdf_list()
+
+    headers = {"Cache-Control": "private, no-cache", "ETag": f'W/"{mtime_ns}"'}
+    if is_not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return pdfs
+
+
 def resolve_user_from_request(request: Request):
     token = None
     auth_header = request.headers.get("authorization", "")
@@ -375,12 +726,20 @@ def resolve_user_from_request(request: Request):
     return token
 
 
+def is_not_modified(request: Request, etag: str):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
 @app.get("/pdf/{pdf_id}")
-def get_pdf(pdf_id: str, request: Request):
+async def get_pdf(pdf_id: str, request: Request):
     resolve_user_from_request(request)
 
-    path = resolve_safe_path(PDF_DIR, pdf_id, ".pdf")
-    if not os.path.exists(path):
+    path = resolve_safe_path(PDF_DIR_REAL, pdf_id, ".pdf")
+    if not await run_in_threadpool(is_regular_file, path):
         raise HTTPException(status_code=404)
 
     safe_pdf_id = quote(pdf_id, safe="")
@@ -394,18 +753,65 @@ def get_pdf(pdf_id: str, request: Request):
     )
 
 
+def ensure_thumbnail(thumb_name: str, path: str):
+    try:
+        stat_result = os.lstat(path)
+    except FileNotFoundError:
+        pdf_path = find_pdf_for_thumbnail(thumb_name)
+        if pdf_path is None:
+            raise HTTPException(status_code=404)
+        try:
+            pdf_mtime_ns = os.stat(pdf_path).st_mtime_ns
+        except FileNotFoundError:
+            raise HTTPException(status_code=404) from None
+        # Don't re-parse a PDF that already failed until it changes.
+        if _thumbnail_failures.get(pdf_path) == pdf_mtime_ns:
+            raise HTTPException(status_code=404)
+        try:
+            generate_thumbnail(pdf_path, path)
+        except Exception as e:  # noqa: BLE001
+            pdf_file = os.path.basename(pdf_path)
+            print(f"[thumbnail] thumbnail generation failed: {pdf_file} ({e})")
+            _thumbnail_failures[pdf_path] = pdf_mtime_ns
+            while len(_thumbnail_failures) > THUMBNAIL_FAILURES_MAX_ENTRIES:
+                _thumbnail_failures.popitem(last=False)
+            raise HTTPException(status_code=404) from None
+        _thumbnail_failures.pop(pdf_path, None)
+        stat_result = os.lstat(path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404)
+    return stat_result
+
+
 @app.get("/thumbnail/{thumb_name}")
-def get_thumbnail(thumb_name: str, request: Request):
+async def get_thumbnail(thumb_name: str, request: Request):
     resolve_user_from_request(request)
-    path = resolve_safe_path(THUMB_DIR, thumb_name, ".jpg")
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404)
+    path = resolve_safe_path(THUMB_DIR_REAL, thumb_name, ".jpg")
+    stat_result = await run_in_threadpool(ensure_thumbnail, thumb_name, path)
+
+    headers = {"Cache-Control": "private, max-age=3600"}
+    if THUMBNAIL_X_ACCEL_REDIRECT:
+        # nginx sends the file itself and answers If-None-Match on its own.
+        safe_thumb_name = quote(thumb_name, safe="")
+        return Response(
+            status_code=200,
+            headers={
+                **headers,
+                "X-Accel-Redirect": f"/_protected_thumbs/{safe_thumb_name}",
+                "Content-Type": "image/jpeg",
+            },
+        )
 
-    return FileResponse(
+    response = FileResponse(
         path,
         media_type="image/jpeg",
-        headers={"Cache-Control": "private, max-age=3600"},
+        headers=headers,
+        stat_result=stat_result,
     )
+    etag = response.headers["etag"]
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    return response
 
 
 @app.get("/search")
@@ -414,7 +820,7 @@ def search_pdfs(
     page: int = 1,
     per_page: int = 20,
     user=Depends(get_current_user),
-):
+) -> dict:
     if page < 1:
         raise HTTPException(status_code=400, detail="page must be >= 1")
     if per_page < 1:
@@ -422,26 +828,16 @@ def search_pdfs(
     if per_page > 100:
         per_page = 100
 
-    maybe_sync_search_index(force=False)
     match_query = build_fts_query(q)
     offset = (page - 1) * per_page
 
-    with closing(get_db_connection()) as conn:
-        total = conn.execute(
-            """
-            SELECT COUNT(*) AS total
-            FROM (
-                SELECT pdf_id
-                FROM pdf_index
-                WHERE pdf_index MATCH ?
-                GROUP BY pdf_id
-            ) g
-            """,
-            (match_query,),
-        ).fetchone()["total"]
-
-        rows = conn.execute(
-            """
+    # Plain tuples are cheaper than sqlite3.Row for the per-row unpacking below.
+    cursor = get_read_db_connection().cursor()
+    cursor.row_factory = None
+    # A single MATCH pass returns both the page of groups and the total group count.
+    rows = cursor.execute(
+        """
+        WITH g AS (
             SELECT
                 pdf_id,
                 title,
@@ -449,13 +845,34 @@ def search_pdfs(
             FROM pdf_index
             WHERE pdf_index MATCH ?
             GROUP BY pdf_id, title
-            ORDER BY hit_count DESC, title ASC
-            LIMIT ?
-            OFFSET ?
+        )
+        SELECT
+            pdf_id,
+            title,
+            hit_count,
+            COUNT(*) OVER () AS total
+        FROM g
+        ORDER BY hit_count DESC, title ASC
+        LIMIT ?
+        OFFSET ?
+        """,
+        (match_query, per_page, offset),
+    ).fetchall()
+
+    if rows:
+        total = rows[0][3]
+    elif offset:
+        # Past the last page no row carries the window count, so count separately.
+        total = cursor.execute(
+            """
+            SELECT COUNT(DISTINCT pdf_id)
+            FROM pdf_index
+            WHERE pdf_index MATCH ?
             """,
-            (match_query, per_page, offset),
-        ).fetchall()
-
+            (match_query,),
+        ).fetchone()[0]
+    else:
+        total = 0
     total_pages = (total + per_page - 1) // per_page if total > 0 else 0
     return {
         "query": q,
@@ -465,12 +882,8 @@ def search_pdfs(
         "total_pages": total_pages,
         "count": len(rows),
         "results": [
-            {
-                "id": row["pdf_id"],
-                "title": row["title"],
-                "hit_count": row["hit_count"],
-            }
-            for row in rows
+            {"id": pdf_id, "title": title, "hit_count": hit_count}
+            for pdf_id, title, hit_count, _ in rows
         ],
     }
 
@@ -482,7 +895,7 @@ def search_pdf_details(
     page: int = 1,
     per_page: int = 20,
     user=Depends(get_current_user),
-):
+) -> dict:
     if page < 1:
         raise HTTPException(status_code=400, detail="page must be >= 1")
     if per_page < 1:
@@ -490,22 +903,18 @@ def search_pdf_details(
     if per_page > 100:
         per_page = 100
 
-    maybe_sync_search_index(force=False)
     match_query = build_fts_query(q)
     offset = (page - 1) * per_page
 
-    with closing(get_db_connection()) as conn:
-        total = conn.execute(
-            """
-            SELECT COUNT(*) AS total
-            FROM pdf_index
-            WHERE pdf_index MATCH ? AND pdf_id = ?
-            """,
-            (match_query, pdf_id),
-        ).fetchone()["total"]
-
-        rows = conn.execute(
-            """
+    cursor = get_read_db_connection().cursor()
+    cursor.row_factory = None
+    # FTS5 auxiliary functions cannot share a SELECT with window functions,
+    # so the MATCH runs in a CTE and the total is counted over its rows.
+    # The pdf_id filter stays inside the CTE: the plan is still driven by the
+    # MATCH (INDEX 0:M), and snippet() only runs for this PDF's hits.
+    rows = cursor.execute(
+        """
+        WITH m AS (
             SELECT
                 pdf_id,
                 title,
@@ -518,18 +927,40 @@ def search_pdf_details(
                     ' ... ',
                     10
                 ) AS snippet,
-                bm25(pdf_index) AS score
+                rank AS score
+            FROM pdf_index
+            WHERE pdf_index MATCH ? AND pdf_id = ?
+        )
+        SELECT
+            pdf_id,
+            title,
+            page,
+            snippet,
+            COUNT(*) OVER () AS total
+        FROM m
+        ORDER BY score
+        LIMIT ?
+        OFFSET ?
+        """,
+        (match_query, pdf_id, per_page, offset),
+    ).fetchall()
+
+    if rows:
+        total = rows[0][4]
+    elif offset:
+        # Past the last page no row carries the window count, so count separately.
+        total = cursor.execute(
+            """
+            SELECT COUNT(*)
             FROM pdf_index
             WHERE pdf_index MATCH ? AND pdf_id = ?
-            ORDER BY score
-            LIMIT ?
-            OFFSET ?
             """,
-            (match_query, pdf_id, per_page, offset),
-        ).fetchall()
-
+            (match_query, pdf_id),
+        ).fetchone()[0]
+    else:
+        total = 0
     total_pages = (total + per_page - 1) // per_page if total > 0 else 0
-    title = rows[0]["title"] if rows else pdf_id
+    title = rows[0][1] if rows else pdf_id
     return {
         "query": q,
         "id": pdf_id,
@@ -540,12 +971,7 @@ def search_pdf_details(
         "total_pages": total_pages,
         "count": len(rows),
         "results": [
-            {
-                "id": row["pdf_id"],
-                "title": row["title"],
-                "page": row["page"],
-                "snippet": row["snippet"],
-            }
-            for row in rows
+            {"id": row_pdf_id, "title": row_title, "page": row_page, "snippet": snippet}
+            for row_pdf_id, row_title, row_page, snippet, _ in rows
         ],
     }
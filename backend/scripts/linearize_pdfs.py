@@ -2,15 +2,20 @@
 import argparse
 import os
 import subprocess
+from multiprocessing import Pool
 from pathlib import Path
 
 import fitz
 
 
 def is_linearized(pdf_path: Path) -> bool:
+    # The spec requires the linearization dictionary within the first 1024 bytes.
     try:
-        with pdf_path.open("rb") as f:
-            head = f.read(4096)
+        fd = os.open(pdf_path, os.O_RDONLY)
+        try:
+            head = os.pread(fd, 1024, 0)
+        finally:
+            os.close(fd)
         return b"/Linearized" in head
     except OSError:
         return False
@@ -72,6 +77,15 @@ def linearize_pdf(pdf_path: Path, force: bool = False, dry_run: bool = False) ->
             ) from fitz_err
 
 
+def _linearize_one(job: tuple[Path, bool, bool]) -> tuple[str, str | None, str | None]:
+    pdf, force, dry_run = job
+    try:
+        return pdf.name, linearize_pdf(pdf, force=force, dry_run=dry_run), None
+    except Exception as e:  # noqa: BLE001
+        # Send the message, not the exception: not every exception survives pickling.
+        return pdf.name, None, str(e)
+
+
 def main():
     script_dir = Path(__file__).resolve().parent
     repo_root = script_dir.parent.parent
@@ -100,6 +114,12 @@ def main():
         action="store_true",
         help="Show what would be converted without writing files.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=min(os.cpu_count() or 1, 8),
+        help="Number of PDFs to linearize in parallel.",
+    )
     args = parser.parse_args()
 
     pdf_dir = Path(args.pdf_dir)
@@ -115,17 +135,20 @@ def main():
     skipped = 0
     failed = 0
 
-    for pdf in files:
-        try:
-            status = linearize_pdf(pdf, force=args.force, dry_run=args.dry_run)
-            if status in {"converted", "would-convert"}:
+    jobs = [(pdf, args.force, args.dry_run) for pdf in files]
+    workers = max(min(args.workers, len(jobs)), 1)
+    # qpdf is single-threaded per file, so spread files across processes.
+    with Pool(workers) as pool:
+        for name, status, error in pool.imap_unordered(_linearize_one, jobs):
+            if error is not None:
+                failed += 1
+                print(f"failed: {name} ({error})")
+                continue
+            if status.startswith(("converted", "would-convert")):
                 converted += 1
             else:
                 skipped += 1
-            print(f"{status}: {pdf.name}")
-        except Exception as e:  # noqa: BLE001
-            failed += 1
-            print(f"failed: {pdf.name} ({e})")
+            print(f"{status}: {name}")
 
     print(
         f"done: converted={converted}, skipped={skipped}, failed={failed}, dry_run={args.dry_run}"
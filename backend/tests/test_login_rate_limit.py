@@ -0,0 +1,75 @@
+import os
+import unittest
+
+import bcrypt
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-for-rate-limit-tests")
+os.environ.setdefault("USER_USERNAME", "user")
+os.environ.setdefault(
+    "USER_PASSWORD_HASH", bcrypt.hashpw(b"password", bcrypt.gensalt(4)).decode("utf-8")
+)
+
+from app import main  # noqa: E402
+
+
+class LoginRateLimitTest(unittest.TestCase):
+    def setUp(self):
+        main._login_attempts.clear()
+        main._login_blocked_until.clear()
+        self.key = ("203.0.113.1", "user")
+
+    def register_failures(self, count: int, start: float = 1000.0, spacing: float = 0.001):
+        now = start
+        for _ in range(count):
+            main.register_login_failure(self.key, now)
+            now += spacing
+        return now
+
+    def test_max_attempts_quick_failures_block(self):
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS)
+        self.assertGreater(main.is_login_blocked(self.key, now), 0)
+
+    def test_one_fewer_failure_does_not_block(self):
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS - 1)
+        self.assertEqual(main.is_login_blocked(self.key, now), 0)
+
+    def test_block_expires(self):
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS)
+        self.assertEqual(
+            main.is_login_blocked(self.key, now + main.LOGIN_RATE_LIMIT_BLOCK_SECONDS), 0
+        )
+
+    def test_spaced_failures_within_window_block(self):
+        spacing = main.LOGIN_RATE_LIMIT_WINDOW_SECONDS / main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS, spacing=spacing)
+        self.assertGreater(main.is_login_blocked(self.key, now - spacing), 0)
+
+    def test_late_failure_after_quick_ones_blocks(self):
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS - 1)
+        now += main.LOGIN_RATE_LIMIT_WINDOW_SECONDS - 1
+        main.register_login_failure(self.key, now)
+        self.assertGreater(main.is_login_blocked(self.key, now), 0)
+
+    def test_failures_spread_beyond_window_do_not_block(self):
+        # max_attempts failures this far apart always span more than the window.
+        gaps = main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS - 1
+        spacing = main.LOGIN_RATE_LIMIT_WINDOW_SECONDS / gaps + 1
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS * 3, spacing=spacing)
+        self.assertEqual(main.is_login_blocked(self.key, now - spacing), 0)
+
+    def test_first_failure_after_block_does_not_block(self):
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS)
+        now += main.LOGIN_RATE_LIMIT_BLOCK_SECONDS
+        self.assertEqual(main.is_login_blocked(self.key, now), 0)
+        main.register_login_failure(self.key, now)
+        self.assertEqual(main.is_login_blocked(self.key, now), 0)
+
+    def test_success_clears_failures(self):
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS - 1)
+        main.clear_login_failures(self.key)
+        now = self.register_failures(main.LOGIN_RATE_LIMIT_MAX_ATTEMPTS - 1, start=now)
+        self.assertEqual(main.is_login_blocked(self.key, now), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import bcrypt
+import fitz
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-for-search-index-tests")
+os.environ.setdefault("USER_USERNAME", "user")
+os.environ.setdefault(
+    "USER_PASSWORD_HASH", bcrypt.hashpw(b"password", bcrypt.gensalt(4)).decode("utf-8")
+)
+
+from app import main  # noqa: E402
+
+
+class InlineExecutor:
+    """Runs jobs in-process; after ``crash_after`` jobs the pool breaks like a dead worker."""
+
+    crash_after: int | None = None
+
+    def __init__(self, *args, **kwargs):
+        self.submitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, pdf_path, pdf_id):
+        future = Future()
+        self.submitted += 1
+        if self.crash_after is not None and self.submitted > self.crash_after:
+            future.set_exception(BrokenProcessPool("worker died"))
+            return future
+        try:
+            future.set_result(fn(pdf_path, pdf_id))
+        except Exception as e:  # noqa: BLE001
+            future.set_exception(e)
+        return future
+
+
+class SearchIndexSyncTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.pdf_dir = os.path.join(tmp.name, "pdfs")
+        os.mkdir(self.pdf_dir)
+
+        main._db_local.conn = None
+        patches = [
+            mock.patch.object(main, "PDF_DIR", self.pdf_dir),
+            mock.patch.object(main, "DB_PATH", os.path.join(tmp.name, "search.db")),
+            mock.patch.object(
+                main, "SEARCH_INDEX_LOCK_PATH", os.path.join(tmp.name, "search.lock")
+            ),
+            mock.patch.object(
+                main, "SEARCH_SCHEMA_LOCK_PATH", os.path.join(tmp.name, "search-schema.lock")
+            ),
+            mock.patch.object(main, "SEARCH_INDEX_WORKERS", 2),
+            mock.patch.object(main, "ProcessPoolExecutor", InlineExecutor),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.close_connection)
+        InlineExecutor.crash_after = None
+
+        for n in range(3):
+            with fitz.open() as doc:
+                doc.new_page().insert_text((72, 72), f"zebra doc{n}")
+                doc.save(os.path.join(self.pdf_dir, f"doc{n}.pdf"))
+        main.init_search_db()
+
+    def close_connection(self):
+        main._db_local.conn.close()
+        main._db_local.conn = None
+
+    def page_counts(self):
+        conn = main.get_db_connection()
+        return dict(conn.execute("SELECT pdf_id, page_count FROM pdf_index_meta"))
+
+    def test_unreadable_pdf_is_recorded_empty(self):
+        with open(os.path.join(self.pdf_dir, "broken.pdf"), "wb") as f:
+            f.write(b"not a pdf")
+
+        main.sync_search_index()
+
+        self.assertEqual(
+            self.page_counts(), {"doc0.pdf": 1, "doc1.pdf": 1, "doc2.pdf": 1, "broken.pdf": 0}
+        )
+
+    def test_broken_pool_leaves_files_for_the_next_sync(self):
+        InlineExecutor.crash_after = 1
+        main.sync_search_index()
+        # Only the file extracted before the crash is recorded, and not as empty.
+        self.assertEqual(list(self.page_counts().values()), [1])
+
+        InlineExecutor.crash_after = None
+        main.sync_search_index()
+        self.assertEqual(self.page_counts(), {"doc0.pdf": 1, "doc1.pdf": 1, "doc2.pdf": 1})
+
+    def test_init_does_not_wait_for_a_running_sync(self):
+        main.sync_search_index()
+        # A sync in another worker: the index lock plus an open write transaction.
+        writer = sqlite3.connect(main.DB_PATH)
+        self.addCleanup(writer.close)
+        with main.exclusive_file_lock(main.SEARCH_INDEX_LOCK_PATH):
+            writer.execute("BEGIN IMMEDIATE")
+            writer.execute("DELETE FROM pdf_index_meta")
+
+            thread = threading.Thread(target=self.init_in_new_connection, daemon=True)
+            thread.start()
+            thread.join(timeout=2)
+            self.assertFalse(thread.is_alive())
+            writer.rollback()
+
+    def init_in_new_connection(self):
+        main.init_search_db()
+        main._db_local.conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
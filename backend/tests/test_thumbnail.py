@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import bcrypt
+import fitz
+from fastapi import HTTPException
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-for-thumbnail-tests")
+os.environ.setdefault("USER_USERNAME", "user")
+os.environ.setdefault(
+    "USER_PASSWORD_HASH", bcrypt.hashpw(b"password", bcrypt.gensalt(4)).decode("utf-8")
+)
+
+from app import main  # noqa: E402
+
+
+class EnsureThumbnailTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.pdf_dir = os.path.join(tmp.name, "pdfs")
+        self.thumb_dir = os.path.join(tmp.name, "thumbnails")
+        os.mkdir(self.pdf_dir)
+        os.mkdir(self.thumb_dir)
+
+        patches = [
+            mock.patch.object(main, "PDF_DIR", self.pdf_dir),
+            mock.patch.object(main, "_thumbnail_failures", main.OrderedDict()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def ensure(self, name: str):
+        thumb_name = f"{name}.jpg"
+        return main.ensure_thumbnail(thumb_name, os.path.join(self.thumb_dir, thumb_name))
+
+    def test_renders_missing_thumbnail(self):
+        with fitz.open() as doc:
+            doc.new_page()
+            doc.save(os.path.join(self.pdf_dir, "doc.pdf"))
+
+        self.assertGreater(self.ensure("doc").st_size, 0)
+
+    def test_unreadable_pdf_is_404_and_not_reparsed(self):
+        pdf_path = os.path.join(self.pdf_dir, "broken.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"not a pdf")
+
+        with mock.patch.object(main, "generate_thumbnail", wraps=main.generate_thumbnail) as gen:
+            for _ in range(2):
+                with self.assertRaises(HTTPException) as cm:
+                    self.ensure("broken")
+                self.assertEqual(cm.exception.status_code, 404)
+            self.assertEqual(gen.call_count, 1)
+
+            # A replaced file is tried again.
+            with fitz.open() as doc:
+                doc.new_page()
+                doc.save(pdf_path)
+            os.utime(pdf_path, ns=(0, 0))
+            self.ensure("broken")
+            self.assertEqual(gen.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -61,6 +61,7 @@ LOGIN_RATE_LIMIT_MAX_ATTEMPTS="5"
 LOGIN_RATE_LIMIT_BLOCK_SECONDS="300"
 SEARCH_INDEX_SYNC_MIN_INTERVAL_SECONDS="30"
 PREWARM_THUMBNAILS_ON_STARTUP="true"
+BCRYPT_COST="${BCRYPT_COST:-10}"
 
 python3 - <<'PY'
 from importlib.util import find_spec
@@ -71,7 +72,7 @@ if find_spec("bcrypt") is None:
 PY
 
 HASH="$(
-  printf '%s' "${PASSWORD1}" | python3 -c $'import sys\nimport bcrypt\np = sys.stdin.read().rstrip("\\r\\n").encode("utf-8")\nif not p:\n    raise SystemExit("empty password")\nif len(p) > 72:\n    raise SystemExit("password must be 72 bytes or less for bcrypt")\nprint(bcrypt.hashpw(p, bcrypt.gensalt()).decode())'
+  printf '%s' "${PASSWORD1}" | BCRYPT_COST="${BCRYPT_COST}" python3 -c $'import os\nimport sys\nimport bcrypt\np = sys.stdin.read().rstrip("\\r\\n").encode("utf-8")\nif not p:\n    raise SystemExit("empty password")\nif len(p) > 72:\n    raise SystemExit("password must be 72 bytes or less for bcrypt")\nprint(bcrypt.hashpw(p, bcrypt.gensalt(rounds=int(os.environ["BCRYPT_COST"]))).decode())'
 )"
 if [[ -z "${HASH}" ]]; then
   echo "Failed to generate USER_PASSWORD_HASH." >&2